@@ -8,6 +8,9 @@
 # and a I2C bus at address 0x11 which connects to a 5 IR Sensor array
 # where each sensor returns a value between 0 and 256
 
+import sys
+from array import array
+
 import smbus2
 from RPi import GPIO
 
@@ -42,6 +45,9 @@ class Sensor:
     def __init__(self, address: int = 0x11):
         self.bus = smbus2.SMBus(1)
         self.address = address
+        # Reused buffers for the last read and the read in progress
+        self.buffer = array('H', [0, 0, 0, 0, 0])
+        self._scratch = array('H', [0, 0, 0, 0, 0])
 
     def read_raw(self):
         result = None
@@ -58,14 +64,16 @@ class Sensor:
         for _ in range(trys):
             raw_result = self.read_raw()
             if raw_result:
-                analog_result = [0, 0, 0, 0, 0]
-                for i in range(0, 5):
-                    high_byte = raw_result[i*2] << 8
-                    low_byte = raw_result[i*2+1]
-                    analog_result[i] = high_byte + low_byte
-                    if analog_result[i] > 1024:
-                        continue
-                return analog_result
+                # Five big-endian 16-bit values, decoded in place
+                scratch = self._scratch
+                memoryview(scratch).cast('B')[:] = bytes(raw_result)
+                if sys.byteorder == 'little':
+                    scratch.byteswap()
+                # Retry on out of range values
+                if max(scratch) > 1024:
+                    continue
+                self.buffer[:] = scratch
+                return self.buffer
         else:
             raise IOError("Line follower read error. Please check the wiring.")
 
@@ -76,7 +84,7 @@ if __name__ == "__main__":
         reset_pins()
 
         sensor = Sensor()
-        last_successful_read = [0, 0, 0, 0, 0]
+        last_successful_read = sensor.buffer
 
         # TURN ON MOTORS
         GPIO.output(MC1PWM, GPIO.HIGH)
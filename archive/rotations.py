@@ -7,56 +7,59 @@
 ENCODER_A_PIN = 22
 ENCODER_B_PIN = 27
 
-import RPi.GPIO as GPIO
+import pigpio
 import time
 
-# Setup GPIO
-GPIO.setmode(GPIO.BCM)
-GPIO.setup(ENCODER_A_PIN, GPIO.IN, pull_up_down=GPIO.PUD_UP)
-GPIO.setup(ENCODER_B_PIN, GPIO.IN, pull_up_down=GPIO.PUD_UP)
+# Setup GPIO, pigpio samples the pins using DMA and reports edges to us
+pi = pigpio.pi()
+pi.set_mode(ENCODER_A_PIN, pigpio.INPUT)
+pi.set_mode(ENCODER_B_PIN, pigpio.INPUT)
+pi.set_pull_up_down(ENCODER_A_PIN, pigpio.PUD_UP)
+pi.set_pull_up_down(ENCODER_B_PIN, pigpio.PUD_UP)
 
 # Variables for counting pulses
 pulse_count = 0
 pulses_per_revolution = 20  # Set this to the number of pulses per full rotation of the encoder
 
-# Previous states
-previous_state_a = GPIO.input(ENCODER_A_PIN)
-previous_state_b = GPIO.input(ENCODER_B_PIN)
+# Converts pulses per second to RPM
+RPM_SCALE = 60.0 / pulses_per_revolution
 
-def count_pulses():
-    global pulse_count, previous_state_a, previous_state_b
+# State of B, tracked from its edges so A's callback doesn't need to read the pin
+state_b = pi.read(ENCODER_B_PIN)
 
-    # Read current states
-    current_state_a = GPIO.input(ENCODER_A_PIN)
-    current_state_b = GPIO.input(ENCODER_B_PIN)
+def on_edge_b(gpio, level, tick):
+    global state_b
+    if level != pigpio.TIMEOUT:
+        state_b = level
 
-    # Check for a rising edge on A
-    if previous_state_a == 0 and current_state_a == 1:
-        # Determine the direction based on B's state
-        if current_state_b == 0:
-            pulse_count += 1  # Forward rotation
-        else:
-            pulse_count -= 1  # Reverse rotation
+def on_rising_edge(gpio, level, tick):
+    global pulse_count
 
-    # Update previous states
-    previous_state_a = current_state_a
-    previous_state_b = current_state_b
+    # Determine the direction based on B's state
+    if state_b == 0:
+        pulse_count += 1  # Forward rotation
+    else:
+        pulse_count -= 1  # Reverse rotation
+
+# Track B and count pulses on every rising edge on A
+callback_b = pi.callback(ENCODER_B_PIN, pigpio.EITHER_EDGE, on_edge_b)
+callback = pi.callback(ENCODER_A_PIN, pigpio.RISING_EDGE, on_rising_edge)
 
 try:
     while True:
         pulse_count = 0  # Reset pulse count
-        start_time = time.time()
 
-        # Measure pulses for 1 second
-        while time.time() - start_time < 1:
-            count_pulses()  # Continuously check the encoder state
+        # Measure pulses for 1 second, counting happens in the callback
+        time.sleep(1)
 
         # Calculate RPM
-        rpm = (pulse_count / pulses_per_revolution) * 60
+        rpm = pulse_count * RPM_SCALE
         print(f"RPM: {rpm}")
 
 except KeyboardInterrupt:
     print("Stopped by User")
 
 finally:
-    GPIO.cleanup()
+    callback.cancel()
+    callback_b.cancel()
+    pi.stop()
@@ -18,9 +18,10 @@ bus = smbus2.SMBus(1)
 def read_adc(channel):
     if channel < 0 or channel > 3:
         return -1
-    bus.write_byte(ADDRESS, 0x40 | channel)  # Set control byte for ADC channel
-    bus.read_byte(ADDRESS)  # Dummy read to start ADC conversion
-    return bus.read_byte(ADDRESS)  # Read the ADC value
+    # Set control byte for ADC channel and read in a single transaction,
+    # the first byte is the previous conversion result
+    data = bus.read_i2c_block_data(ADDRESS, 0x40 | channel, 2)
+    return data[1]  # Read the ADC value
 
 try:
     while True:
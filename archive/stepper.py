@@ -6,49 +6,55 @@ This demo is for spinning a Stepper motor clickwise and counter-clockwise
 
 import time
 from enum import Enum
-from typing import Union
 
-from RPi import GPIO
+import pigpio
 
 
 class Direction(Enum):
     """Enum for directions in which a stepper can rotate"""
-    CLOCKWISE = GPIO.LOW
-    COUNTERCLOCKWISE = GPIO.HIGH
+    CLOCKWISE = pigpio.LOW
+    COUNTERCLOCKWISE = pigpio.HIGH
 
 
-def spin(power_pin: int, direction_pin: int, direction: Direction, length_seconds: float, interval: float = 0.0208):
+def spin(pi: pigpio.pi, power_pin: int, direction_pin: int, direction: Direction, length_seconds: float, interval: float = 0.0208):
     """Rotate Stepper in a given direction for n seconds"""
-    assert GPIO.getmode() == GPIO.BCM, "GPIO mode should be BCM"
-
     # Set the direction pin
-    GPIO.output(direction_pin, direction.value)
+    pi.write(direction_pin, direction.value)
 
-    # Log the start time
-    start = time.monotonic()
+    # Build a single step as a wave, pigpio repeats it using DMA
+    half_period_us = int(interval * 1_000_000 / 2)
+    pi.wave_clear()
+    pi.wave_add_generic([
+        pigpio.pulse(1 << power_pin, 0, half_period_us),
+        pigpio.pulse(0, 1 << power_pin, half_period_us),
+    ])
+    wave = pi.wave_create()
 
     # Rotate until we reach timeout
-    while (time.monotonic() - start) < length_seconds:
-        GPIO.output(power_pin, GPIO.HIGH)
-        time.sleep(interval)
-        GPIO.output(power_pin, GPIO.LOW)
+    pi.wave_send_repeat(wave)
+    try:
+        time.sleep(length_seconds)
+    finally:
+        pi.wave_tx_stop()
+        pi.wave_delete(wave)
+        pi.write(power_pin, pigpio.LOW)
 
 
 if __name__ == "__main__":
-    GPIO.setmode(GPIO.BCM)
+    pi = pigpio.pi()
 
     # Raspberry Pi GPIO Pins in our example
     POWER_PIN = 24
     DIRECTION_PIN = 26
 
     # Setup pins
-    GPIO.setup(24, GPIO.OUT)
-    GPIO.setup(26, GPIO.OUT)
+    pi.set_mode(POWER_PIN, pigpio.OUTPUT)
+    pi.set_mode(DIRECTION_PIN, pigpio.OUTPUT)
 
     try:
-        spin(POWER_PIN, DIRECTION_PIN, Direction.CLOCKWISE, length_seconds=3.0)
-        spin(POWER_PIN, DIRECTION_PIN, Direction.COUNTERCLOCKWISE, length_seconds=3.0)
+        spin(pi, POWER_PIN, DIRECTION_PIN, Direction.CLOCKWISE, length_seconds=3.0)
+        spin(pi, POWER_PIN, DIRECTION_PIN, Direction.COUNTERCLOCKWISE, length_seconds=3.0)
     except KeyboardInterrupt:
         pass
     finally:
-        GPIO.cleanup()
+        pi.stop()
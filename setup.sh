@@ -20,7 +20,11 @@ sudo ufw allow 22
 sudo ufw allow 80
 sudo ufw --force enable
 
-# TODO: Append hardware pwm configuration to `/boot/firmware/config.txt`
+# Route hardware PWM to GPIO12 and GPIO13 for the wheel motors, takes
+# effect after a reboot. Without it the motors fall back to software PWM
+PWM_OVERLAY="dtoverlay=pwm-2chan,pin=12,func=4,pin2=13,func2=4"
+grep -qxF "$PWM_OVERLAY" /boot/firmware/config.txt \
+    || echo "$PWM_OVERLAY" | sudo tee -a /boot/firmware/config.txt
 
 # TODO: Install rustup automatically
 
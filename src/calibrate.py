@@ -1,9 +1,10 @@
 import time
-import random
 import logging
-from collections import Counter, defaultdict
+from collections import Counter
 from typing import NamedTuple, TYPE_CHECKING, Optional, Sequence
 
+import numpy as np
+
 from sensors import Sensors
 from vehicle import SpinDirection
 
@@ -32,41 +33,47 @@ def find_two_values_kmeans(
     assert len(data) > 1, "there need to be atleast 2 sensor readings"
     assert max(data) <= 255 and min(data) >= 0, "Sensor data should be between 0-255"
 
+    values = np.asarray(data, dtype=np.int64)
+
+    # Totals over all values, the lower cluster is derived from the upper one
+    total_sum = int(values.sum())
+    total_count = len(values)
+
     # Step 1: Initialize two cluster centers randomly from the data
-    cluster_centers: list[float] = random.sample(list(set(data)), 2)
-    cluster_centers.sort()
+    low, high = sorted(np.random.choice(np.unique(values), 2, replace=False))
+    low, high = float(low), float(high)
 
     for _ in range(max_iterations):
-        clusters: dict[int, list[float]] = {
-            0: [], 1: []
-        }
-
         # Step 2: Assign data points to the nearest cluster center
-        for value in data:
-            distances = [abs(value - center) for center in cluster_centers]
-            cluster_index = distances.index(min(distances))
-            clusters[cluster_index].append(value)
-
-        prev_cluster_centers = cluster_centers.copy()
-
-        # Step 3: Update cluster centers
-        for i in range(2):
-            if clusters[i]:
-                cluster_centers[i] = sum(clusters[i]) / len(clusters[i])
-            else:
-                # Reinitialize the cluster center if it has no data points
-                cluster_centers[i] = random.choice(data)
+        # With two clusters in 1-D, the nearest center is decided by which
+        # side of the midpoint a value is on
+        upper = values >= (low + high) / 2
+
+        prev_low, prev_high = low, high
+
+        # Step 3: Update cluster centers from the sum and count of each
+        # cluster, without copying the cluster values out of the data
+        high_sum = int(np.dot(values, upper))
+        high_count = int(np.count_nonzero(upper))
+        low_sum = total_sum - high_sum
+        low_count = total_count - high_count
+
+        # Reinitialize the cluster center if it has no data points
+        low = (
+            low_sum / low_count if low_count
+            else float(np.random.choice(values))
+        )
+        high = (
+            high_sum / high_count if high_count
+            else float(np.random.choice(values))
+        )
 
         # Check for convergence
-        shifts = [
-            abs(prev_cluster_centers[i] - cluster_centers[i])
-            for i in range(2)
-        ]
-        if max(shifts) < tolerance:
+        if max(abs(prev_low - low), abs(prev_high - high)) < tolerance:
             break
 
     # Floor and line value
-    return CalibratedSensor(max(cluster_centers), min(cluster_centers))
+    return CalibratedSensor(max(low, high), min(low, high))
 
 
 def find_two_values_historgram(
@@ -123,6 +130,45 @@ def find_two_values_historgram(
     return CalibratedSensor(line_value, floor_value)
 
 
+def find_two_values_otsu(histogram: Sequence[int]) -> CalibratedSensor:
+    """
+    Seperate floor and line values using Otsu's method, which picks the
+    threshold that maximizes the variance between the two classes.
+    Runs on a histogram of sensor values, where index i holds the number of
+    times i was read, so no iteration over the readings is needed.
+    """
+    assert len(histogram) == 256, "histogram should have a bin for each value 0-255"
+    histogram = np.asarray(histogram, dtype=np.int64)
+    assert histogram.sum() > 1, "there need to be atleast 2 sensor readings"
+
+    # Step 1: Cumulative counts and sums for every possible threshold
+    counts = histogram.cumsum()
+    sums = (histogram * np.arange(256)).cumsum()
+    total_count = counts[-1]
+    total_mean = sums[-1] / total_count
+
+    # Step 2: Pick the threshold with the largest between-class variance
+    between_variance = (total_mean * counts - sums) ** 2 / (
+        counts * (total_count - counts) + 1e-12
+    )
+    threshold = int(between_variance.argmax())
+    logging.debug("calibration: threshold set at %d" % threshold)
+
+    # Step 3: Calculate the mean values on both sides of the threshold
+    floor_count = counts[threshold]
+    line_count = total_count - floor_count
+    if floor_count == 0 or line_count == 0:
+        raise ZeroDivisionError("LogBot didn't detect a line during calibration")
+
+    floor_value = float(sums[threshold] / floor_count)
+    line_value = float((sums[-1] - sums[threshold]) / line_count)
+
+    logging.debug("calibration: using floor value %d" % floor_value)
+    logging.debug("calibration: using line value %d" % line_value)
+
+    return CalibratedSensor(line_value, floor_value)
+
+
 def calibrate(
     logbot: 'LogBot',
     sensors: Sequence[Sensors] = (Sensors.LEFT, Sensors.RIGHT),
@@ -136,9 +182,6 @@ def calibrate(
     if speed is None:
         speed = logbot.vehicle.default_speed
 
-    # Map of values
-    values: defaultdict[Sensors, list[int]] = defaultdict(list)
-
     # Turn the logbot in-place in both directions and record sensor values
     spin_range_in_seconds = 3
     logging.debug(
@@ -146,6 +189,13 @@ def calibrate(
         % spin_range_in_seconds
     )
 
+    # Count values into a histogram per sensor while sampling, so the
+    # samples themselves never have to be stored or scanned again
+    histograms: dict[Sensors, list[int]] = {
+        sensor: [0] * 256 for sensor in sensors
+    }
+    recorded = 0
+
     # Turn to start reading from the left side
     logbot.vehicle.spin(SpinDirection.LEFT, speed=speed)
     time.sleep(spin_range_in_seconds / 2)
@@ -157,7 +207,8 @@ def calibrate(
 
     while (time.time() - start) < spin_range_in_seconds:
         for sensor in sensors:
-            values[sensor].append(logbot.sensors.read(sensor))
+            histograms[sensor][logbot.sensors.read(sensor)] += 1
+        recorded += 1
 
     logbot.vehicle.stop()
 
@@ -169,8 +220,11 @@ def calibrate(
     for sensor in sensors:
         logging.debug(
             "calibration: recorded %d values from '%s' sensor"
-            % (len(values[sensor]), repr(sensor))
+            % (recorded, repr(sensor))
         )
 
-    # Map dict values from sensor data to CalibratedSensor
-    return {k: find_two_values_kmeans(v) for k, v in values.items() }
+    # Map recorded sensor data to CalibratedSensor
+    return {
+        sensor: find_two_values_otsu(histogram)
+        for sensor, histogram in histograms.items()
+    }
@@ -1,5 +1,13 @@
 #!/usr/bin/env python3
 
+GPIO_CHIP = "/dev/gpiochip0"
+# Hardware PWM assumes a Raspberry Pi 5, where the RP1 PWM controller is
+# usually pwmchip2 (check /sys/class/pwm). On a Raspberry Pi 4 use pwmchip0
+PWM_CHIP = 2
+# Pins driven by hardware PWM and their channel, the same on both boards.
+# Requires 'dtoverlay=pwm-2chan,pin=12,func=4,pin2=13,func2=4' (see setup.sh),
+# other pins and a missing overlay fall back to software PWM
+HARDWARE_PWM_CHANNELS = {12: 0, 13: 1}
 LEFT_MOTOR_POWER_PIN = 13
 LEFT_MOTOR_DIRECTION_PIN = 6
 RIGHT_MOTOR_POWER_PIN = 12
@@ -9,10 +9,10 @@ from RPi import GPIO
 
 from calibrate import calibrate, CalibratedSensor
 import const
-from motors import Motor, LiftMotor, MotorDirection
+from motors import LiftMotor, MotorDirection
 from vehicle import Vehicle, VehicleDirection, SpinDirection
-from sensors import I2CSensors, Sensors, Camera
-from typing import Optional, Callable
+from sensors import I2CSensors, SensorPoller, Sensors, Camera
+from typing import Optional, Callable, Self
 
 logging.basicConfig(level=logging.DEBUG)
 
@@ -21,6 +21,18 @@ Kp = 1.2  # Proportional gain, adjust as needed
 Ki = 0.0  # Intergral gain, adjust as needed
 Kd = 0.6  # Derivative gain, adjust as needed
 
+# Opposite of each spin direction, used when oscillating
+_FLIP = {
+    SpinDirection.LEFT: SpinDirection.RIGHT,
+    SpinDirection.RIGHT: SpinDirection.LEFT,
+}
+
+# Sensor that sees the line first when spinning in a direction
+_SENSOR_FOR = {
+    SpinDirection.LEFT: Sensors.LEFT,
+    SpinDirection.RIGHT: Sensors.RIGHT,
+}
+
 
 class LogBot:
     """ This is the main class for logbot """
@@ -28,9 +40,23 @@ class LogBot:
     def __init__(self, vehicle: Vehicle, sensors: I2CSensors):
         self.vehicle = vehicle
         self.sensors = sensors
+        # Control loops use the latest values sampled in the background
+        self.poller = SensorPoller(sensors)
+        self.poller.start()
 
         self.calibration: Optional[dict[Sensors, CalibratedSensor]] = None
 
+    def __enter__(self) -> Self:
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        """ Stop the sensor poller. """
+        self.close()
+
+    def close(self):
+        """Stop sampling the sensors in the background"""
+        self.poller.stop()
+
     def follow_line_until(
         self,
         until: Callable[[], bool],
@@ -43,16 +69,27 @@ class LogBot:
             assert timeout >= 0, "timeout can't be negative"
             end_time = time.time() + timeout
 
+            # Fold the timeout into the stop condition once, so the loop
+            # doesn't check for it when no timeout is given
+            condition = until
+            until = lambda: condition() or time.time() > end_time
+
+        # Bind lookups to locals, so the loop doesn't repeat them
+        read_lr = self.sensors.read_lr
+        move = self.vehicle.move
+        threshold_left = const.SENSOR_THRESHOLD_LEFT
+        threshold_right = const.SENSOR_THRESHOLD_RIGHT
+
         while not until():
-            if self.sensors.read(Sensors.RIGHT) > const.SENSOR_THRESHOLD_RIGHT:
-                self.vehicle.move(VehicleDirection.RIGHT)
-            elif self.sensors.read(Sensors.LEFT) > const.SENSOR_THRESHOLD_LEFT:
-                self.vehicle.move(VehicleDirection.LEFT)
-            else:
-                self.vehicle.move(VehicleDirection.FORWARD)
+            # Read both sensors in a single transaction
+            sensor_left, sensor_right = read_lr()
 
-            if timeout is not None and time.time() > end_time:
-                break
+            if sensor_right > threshold_right:
+                move(VehicleDirection.RIGHT)
+            elif sensor_left > threshold_left:
+                move(VehicleDirection.LEFT)
+            else:
+                move(VehicleDirection.FORWARD)
 
         self.vehicle.stop()
 
@@ -62,10 +99,27 @@ class LogBot:
         last_error = 0
         base_speed = self.vehicle.speed  # Base speed of the vehicle
 
+        # Bind lookups to locals, so the loop doesn't repeat them
+        latest = self.poller.latest
+        wait = self.poller.wait
+        left, right = Sensors.LEFT.value, Sensors.RIGHT.value
+        left_move = self.vehicle.left.move
+        right_move = self.vehicle.right.move
+        forward = MotorDirection.FORWARD
+        kp, kd = Kp, Kd
+        sample = -1  # Number of the last sample used, the first is taken as is
+
         while not until():
-            # Read sensor values
-            sensor_left = self.sensors.read(Sensors.LEFT)
-            sensor_right = self.sensors.read(Sensors.RIGHT)
+            # Run once per sample, so the derivative compares consecutive
+            # samples and the motors aren't updated with the same values
+            new_sample = wait(sample)
+            if new_sample == sample:
+                continue  # No sample in time, check the stop condition again
+            sample = new_sample
+
+            # Read the latest sensor values
+            sensor_left = latest[left]
+            sensor_right = latest[right]
 
             # Calculate the error
             error = sensor_left - sensor_right
@@ -75,7 +129,7 @@ class LogBot:
             last_error = error
 
             # PD control output
-            control = Kp * error + Kd * derivative
+            control = kp * error + kd * derivative
 
             # Adjust motor speeds based on control output
             left_speed = base_speed - control
@@ -88,8 +142,8 @@ class LogBot:
             # Move the vehicle with adjusted speeds
             # TODO: Since we call motors directly, we might want to get rid of
             # the vehicle abstraction
-            self.vehicle.left.move(MotorDirection.FORWARD, left_speed)
-            self.vehicle.right.move(MotorDirection.FORWARD, right_speed)
+            left_move(forward, left_speed)
+            right_move(forward, right_speed)
 
         self.vehicle.stop()
 
@@ -127,13 +181,7 @@ class LogBot:
             if (timestamp - duration_start) > duration:
                 duration *= 2
                 duration_start = timestamp
-                match direction:
-                    case SpinDirection.RIGHT:
-                        direction = SpinDirection.LEFT
-                    case SpinDirection.LEFT:
-                        direction = SpinDirection.RIGHT
-                    case _:
-                        raise NotImplementedError()
+                direction = _FLIP[direction]
                 self.vehicle.spin(direction, speed=speed)
 
         self.vehicle.stop()
@@ -193,37 +241,70 @@ class LogBot:
         integral_value = 0.0
 
         # Calculate estimated max error based on calibration
-        max_error = calibration.average() - min(calibration.line, calibration.floor)
+        average = calibration.average()
+        max_error = average - min(calibration.line, calibration.floor)
 
-        start = time.monotonic()
+        # Precompute reciprocals, so the loop can multiply instead of divide
+        inverse_max_error = 1.0 / max_error
+        inverse_acceleration_time = (
+            1.0 / acceleration_time if acceleration_time > 0 else 0.0
+        )
+
+        # Bind lookups to locals, so the loop doesn't repeat them
+        latest = self.poller.latest
+        wait = self.poller.wait
+        channel = sensor.value
+        vehicle = self.vehicle
+        left_set_speed = vehicle.left.set_speed
+        right_set_speed = vehicle.right.set_speed
+        monotonic = time.monotonic
+        # A zero integral gain disables the integral without branching
+        kp, kd = Kp, Kd
+        ki = Ki if integral else 0.0
+
+        # Both motors only ever move forward, so the direction pins are set
+        # once here and the loop only updates the duty cycle
+        vehicle.left.set_direction(MotorDirection.FORWARD)
+        vehicle.right.set_direction(MotorDirection.FORWARD)
+
+        # Cleared once fully accelerated, so the clock isn't read afterwards
+        accelerating = acceleration_time > 0
+
+        start = monotonic()
+        sample = -1  # Number of the last sample used, the first is taken as is
 
         while not until():
+            # Run once per sample, so the derivative and integral advance
+            # once per sample, independent of how fast the loop spins
+            new_sample = wait(sample)
+            if new_sample == sample:
+                continue  # No sample in time, check the stop condition again
+            sample = new_sample
+
             # Read sensor values
-            sensor_left = self.sensors.read(sensor)
+            sensor_left = latest[channel]
 
             # Calculate the error
-            error = sensor_left - calibration.average()
+            error = sensor_left - average
 
             # Calculate the derivative of the error
             derivative = error - last_error
             last_error = error
 
-            # PD control output
-            control = Kp * error + Kd * derivative
-
-            # Add calculate and add integral if requested
-            if integral:
-                integral_value += error
-                control += integral_value * Ki
+            # PID control output, ki is zero if the integral is not requested
+            integral_value += error
+            control = kp * error + kd * derivative + integral_value * ki
 
             # Get vehicle speed on each iteration to allow dynamic speed
             # changes from outside of the function
-            dynamic_base_speed = self.vehicle.default_speed
+            dynamic_base_speed = vehicle.default_speed
 
             # Adjust speed based on error (slows down on large error)
             if dynamic_speed:
-                error_ratio = abs(error) / max_error
-                multiplier =  1 - max(0.5, min(1, error_ratio))
+                error_ratio = abs(error) * inverse_max_error
+                multiplier = 1 - (
+                    0.5 if error_ratio < 0.5 else 1 if error_ratio > 1 else error_ratio
+                )
                 dynamic_base_speed *= multiplier
 
             # Adjust motor speeds based on control output
@@ -231,24 +312,27 @@ class LogBot:
             right_speed = dynamic_base_speed + control
 
             # Reduce speed to mimic acceleration when applicable
-            if acceleration_time > 0:
-                multiplier = min(1, (time.monotonic() - start) / acceleration_time)
-                left_speed *= multiplier
-                right_speed *= multiplier
-
-            # Clamp speed
-            left_speed = max(0, min(100, left_speed))
-            right_speed = max(0, min(100, right_speed))
+            if accelerating:
+                multiplier = (monotonic() - start) * inverse_acceleration_time
+                if multiplier >= 1:
+                    accelerating = False
+                else:
+                    left_speed *= multiplier
+                    right_speed *= multiplier
+
+            # Clamp speed, conditionals avoid the builtin call overhead
+            left_speed = 0 if left_speed < 0 else 100 if left_speed > 100 else left_speed
+            right_speed = 0 if right_speed < 0 else 100 if right_speed > 100 else right_speed
 
             # Move the vehicle with adjusted speeds
             # TODO: Since we call motors directly, we might want to get rid of
             # the vehicle abstraction
-            self.vehicle.left.move(MotorDirection.FORWARD, left_speed)
-            self.vehicle.right.move(MotorDirection.FORWARD, right_speed)
+            left_set_speed(left_speed)
+            right_set_speed(right_speed)
 
         self.vehicle.stop()
         logging.debug(
-            "Followed line for %d seconds" % round(time.time() - start, 2)
+            "Followed line for %d seconds" % round(time.monotonic() - start, 2)
         )
 
     def detect_stop_line(
@@ -272,10 +356,14 @@ class LogBot:
             left = left_fallback
             right = right_fallback
 
-        return (
-            self.sensors.read(Sensors.LEFT) > left
-            and self.sensors.read(Sensors.RIGHT) > right
-        )
+        # Take both values from the same poll, instead of two separate reads.
+        # The poller writes the pair under this lock
+        latest = self.poller.latest
+        with self.poller.sampled:
+            sensor_left = latest[Sensors.LEFT.value]
+            sensor_right = latest[Sensors.RIGHT.value]
+
+        return sensor_left > left and sensor_right > right
 
     def turn_until_line(
         self,
@@ -295,13 +383,12 @@ class LogBot:
         assert speed >= 0, "speed should not be negative"
         assert initial_spin >= 0, "initial spin should not be negative"
 
-        match direction:
-            case SpinDirection.LEFT:
-                sensor = Sensors.LEFT
-            case SpinDirection.RIGHT:
-                sensor = Sensors.RIGHT
-            case _:
-                raise NotImplementedError()
+        try:
+            sensor = _SENSOR_FOR[direction]
+        except KeyError:
+            raise NotImplementedError(
+                f"SpinDirection not covered: {repr(direction)}"
+            )
 
         if calibration is None:
             if self.calibration is None or sensor not in self.calibration:
@@ -327,19 +414,19 @@ class LogBot:
 
 def main():
     with (
-        Motor.new_right(
-            const.RIGHT_MOTOR_POWER_PIN, const.RIGHT_MOTOR_DIRECTION_PIN
-        ) as right_motor,
-        Motor.new_left(
-            const.LEFT_MOTOR_POWER_PIN, const.LEFT_MOTOR_DIRECTION_PIN
-        ) as left_motor,
+        Vehicle.new(
+            const.LEFT_MOTOR_POWER_PIN,
+            const.LEFT_MOTOR_DIRECTION_PIN,
+            const.RIGHT_MOTOR_POWER_PIN,
+            const.RIGHT_MOTOR_DIRECTION_PIN,
+            default_speed=80,
+        ) as vehicle,
         LiftMotor(
             const.LIFT_POWER_PIN, const.LIFT_DIRECTION_PIN
         ) as lift_motor,
+        LogBot(vehicle, I2CSensors()) as logbot,
     ):
-        sensors = I2CSensors()
         camera = Camera()
-        logbot = LogBot(Vehicle(left_motor, right_motor, default_speed=80), sensors)
 
         # Hardcoded calibration data for left sensor
         calibration = CalibratedSensor(210, 160)
@@ -5,8 +5,12 @@
 import time
 import logging
 from enum import Enum
-from typing import Literal, Self
+from typing import Optional, Self
+
+import gpiod
+from gpiod.line import Direction, Value
 from RPi import GPIO
+from rpi_hardware_pwm import HardwarePWM, HardwarePWMException
 
 import const
 
@@ -21,21 +25,66 @@ class MotorDirection(Enum):
 
 
 class BaseMotor:
-    """Lowest abstraction over a motor, handles pin setup and shutdown"""
+    """
+    Lowest abstraction over a motor, handles pin setup and shutdown.
+    Uses hardware PWM if the power pin has a PWM channel, software PWM otherwise
+    """
 
-    def __init__(self, power_pin: int, direction_pin: int, pwm_frequency: int):
-        """Setup motor pins and pwm"""
+    def __init__(
+        self,
+        power_pin: int,
+        direction_pin: int,
+        pwm_frequency: int,
+        lines: Optional[gpiod.LineRequest] = None,
+    ):
+        """
+        Setup motor pins and pwm.
+        lines: Shared request that includes the direction pin, released by
+        its owner. The direction pin is requested separately if not given
+        """
         self.power_pin = power_pin
         self.direction_pin = direction_pin
         self.speed: float = 0.0
-
-        assert GPIO.getmode() == GPIO.BCM, "GPIO Mode should be BCM"
-        GPIO.setup(power_pin, GPIO.OUT)
-        GPIO.setup(direction_pin, GPIO.OUT)
+        self.pwm_channel = const.HARDWARE_PWM_CHANNELS.get(power_pin)
+
+        # The direction pin is driven through the gpiod character device
+        self._owns_lines = lines is None
+        if lines is None:
+            lines = gpiod.request_lines(
+                const.GPIO_CHIP,
+                consumer="logbot",
+                config={
+                    direction_pin: gpiod.LineSettings(
+                        direction=Direction.OUTPUT, output_value=Value.INACTIVE
+                    )
+                },
+            )
+        self.lines = lines
 
         assert pwm_frequency > 0, "pwm_frequency should be positive"
         self.pwm_frequency = pwm_frequency
-        self.pwm = GPIO.PWM(power_pin, pwm_frequency)
+        if self.pwm_channel is not None:
+            try:
+                # The waveform is generated by the SoC, not by this process
+                self.pwm = HardwarePWM(
+                    pwm_channel=self.pwm_channel,
+                    hz=pwm_frequency,
+                    chip=const.PWM_CHIP,
+                )
+                self._change_duty_cycle = self.pwm.change_duty_cycle
+            except HardwarePWMException as e:
+                # The pwm overlay isn't loaded, see setup.sh
+                logging.warning(
+                    "hardware pwm unavailable on pin %d, using software pwm: %s"
+                    % (power_pin, e)
+                )
+                self.pwm_channel = None
+
+        if self.pwm_channel is None:
+            assert GPIO.getmode() == GPIO.BCM, "GPIO Mode should be BCM"
+            GPIO.setup(power_pin, GPIO.OUT)
+            self.pwm = GPIO.PWM(power_pin, pwm_frequency)
+            self._change_duty_cycle = self.pwm.ChangeDutyCycle
         self.pwm.start(self.speed)
 
     def __enter__(self) -> Self:
@@ -50,10 +99,14 @@ class BaseMotor:
         )
         try:
             self.pwm.stop()
-            GPIO.output(self.power_pin, GPIO.LOW)
-            GPIO.output(self.direction_pin, GPIO.LOW)
+            if self.pwm_channel is None:
+                GPIO.output(self.power_pin, GPIO.LOW)
+            self.lines.set_value(self.direction_pin, Value.INACTIVE)
         finally:
-            GPIO.cleanup((self.power_pin, self.direction_pin))
+            if self.pwm_channel is None:
+                GPIO.cleanup(self.power_pin)
+            if self._owns_lines:
+                self.lines.release()
 
     def set_speed(self, speed: float) -> float:
         """
@@ -67,7 +120,7 @@ class BaseMotor:
 
         previous_speed = self.speed
         self.speed = speed
-        self.pwm.ChangeDutyCycle(self.speed)
+        self._change_duty_cycle(self.speed)
         return previous_speed
 
     def stop(self) -> float:
@@ -79,34 +132,50 @@ class Motor(BaseMotor):
     """Abstraction for a motor that is used for driving"""
 
     @staticmethod
-    def new_right(power_pin: int, direction_pin: int) -> "Motor":
+    def new_right(
+        power_pin: int,
+        direction_pin: int,
+        lines: Optional[gpiod.LineRequest] = None,
+    ) -> "Motor":
         """ Create a new Motor instance with the right wheel configuation """
-        return Motor(power_pin, direction_pin, GPIO.HIGH, GPIO.LOW)
+        return Motor(
+            power_pin, direction_pin, Value.ACTIVE, Value.INACTIVE, lines=lines
+        )
 
     @staticmethod
-    def new_left(power_pin: int, direction_pin: int) -> "Motor":
+    def new_left(
+        power_pin: int,
+        direction_pin: int,
+        lines: Optional[gpiod.LineRequest] = None,
+    ) -> "Motor":
         """ Create a new Motor instance with the left wheel configuation """
-        return Motor(power_pin, direction_pin, GPIO.LOW, GPIO.HIGH)
+        return Motor(
+            power_pin, direction_pin, Value.INACTIVE, Value.ACTIVE, lines=lines
+        )
 
     def __init__(
         self,
         power_pin: int,
         direction_pin: int,
-        forward: Literal[0, 1],
-        backward: Literal[0, 1],
-        pwm_frequency: int = const.PWM_FREQUENCY
+        forward: Value,
+        backward: Value,
+        pwm_frequency: int = const.PWM_FREQUENCY,
+        lines: Optional[gpiod.LineRequest] = None,
     ):
-        super().__init__(power_pin, direction_pin, pwm_frequency)
+        super().__init__(power_pin, direction_pin, pwm_frequency, lines)
 
-        assert forward in (0, 1), "forward needs to be 0 or 1"
-        assert backward in (0, 1), "backwards needs to be 0 or 1"
         assert forward != backward, "forward and backward must be different"
-        self.forward: Literal[0, 1] = forward
-        self.backward: Literal[0, 1] = backward
+        self.forward = forward
+        self.backward = backward
+        # Direction pin value for each MotorDirection
+        self._direction_values = {
+            MotorDirection.FORWARD: forward,
+            MotorDirection.BACKWARD: backward,
+        }
 
         # Default direction pin to forward
         self.direction = self.forward
-        GPIO.output(self.direction_pin, self.forward)
+        self.lines.set_value(self.direction_pin, self.forward)
 
     def move(self, direction: MotorDirection, speed: float):
         """
@@ -115,18 +184,26 @@ class Motor(BaseMotor):
         (Turns motor on or off)
         """
         self.set_speed(speed)
+        self.set_direction(direction)
 
-        match direction:
-            case MotorDirection.FORWARD:
-                GPIO.output(self.direction_pin, self.forward)
-                self.direction = self.forward
-            case MotorDirection.BACKWARD:
-                GPIO.output(self.direction_pin, self.backward)
-                self.direction = self.backward
-            case _:
-                raise NotImplementedError(
-                    f"MotorDirection not covered: {repr(direction)}"
-                )
+    def set_direction(self, direction: MotorDirection):
+        """
+        Set the direction of the motor without changing its speed.
+        The direction pin is only written when the direction changes.
+        """
+        value = self.direction_value(direction)
+        if value != self.direction:
+            self.lines.set_value(self.direction_pin, value)
+            self.direction = value
+
+    def direction_value(self, direction: MotorDirection) -> Value:
+        """ Value of the direction pin for a given MotorDirection """
+        try:
+            return self._direction_values[direction]
+        except KeyError:
+            raise NotImplementedError(
+                f"MotorDirection not covered: {repr(direction)}"
+            )
 
 
 class LiftMotor(BaseMotor):
@@ -185,10 +262,10 @@ class LiftMotor(BaseMotor):
         assert self.stop() == 0.0, "lift should not already be moving"
 
         # Set the direction of the rotation
-        GPIO.output(self.direction_pin, GPIO.HIGH)
+        self.lines.set_value(self.direction_pin, Value.ACTIVE)
 
         # Log start time incase call gets cancelled
-        start = time.time()
+        start_ns = time.monotonic_ns()
         self.set_speed(100.0)
         try:
             time.sleep(duration)
@@ -198,7 +275,7 @@ class LiftMotor(BaseMotor):
             # time.sleep(duration) might get cancelled by an interruption
             # this keeps track of the actual time spent which is used
             # for resetting the pin when the context-manager exists
-            duration = time.time() - start
+            duration = (time.monotonic_ns() - start_ns) / 1e9
             self.movement += duration
 
     def down(self, duration: float = 3.0):
@@ -207,10 +284,10 @@ class LiftMotor(BaseMotor):
         assert self.stop() == 0.0, "lift should not already be moving"
 
         # Set the direction of the rotation
-        GPIO.output(self.direction_pin, GPIO.LOW)
+        self.lines.set_value(self.direction_pin, Value.INACTIVE)
 
         # Log start time incase call gets cancelled
-        start = time.time()
+        start_ns = time.monotonic_ns()
         self.set_speed(100.0)
         try:
             time.sleep(duration)
@@ -220,7 +297,7 @@ class LiftMotor(BaseMotor):
             # time.sleep(duration) might get cancelled by an interruption
             # this keeps track of the actual time spent which is used
             # for resetting the pin when the context-manager exists
-            duration = time.time() - start
+            duration = (time.monotonic_ns() - start_ns) / 1e9
             self.movement -= duration
 
 
@@ -230,24 +307,53 @@ class StepperMotor:
     movement of a motor-like turning mechanism
     """
 
-    clockwise: Literal[0, 1] = GPIO.LOW
-    counter_clockwise: Literal[0, 1] = GPIO.HIGH
+    clockwise: Value = Value.INACTIVE
+    counter_clockwise: Value = Value.ACTIVE
     # The interval at which the steppers state is changed
     interval = 0.0208
+    # The duration of a single step
+    step_interval = 0.0052
 
     def __init__(self, power_pin: int, direction_pin: int):
         """
         Create new Stepper Motor instance and setup the corresponding pins
         """
-        assert GPIO.getmode() == GPIO.BCM, "GPIO Mode should be BCM"
-
         self.power_pin = power_pin
         self.direction_pin = direction_pin
-        self._up: Literal[0, 1] = self.clockwise
-        self._down: Literal[0, 1] = self.counter_clockwise
+        self._up: Value = self.clockwise
+        self._down: Value = self.counter_clockwise
+
+        # Steps are generated by hardware PWM if the power pin supports it,
+        # otherwise the power pin is pulsed through gpiod
+        self.pwm_channel = const.HARDWARE_PWM_CHANNELS.get(power_pin)
+        self.pwm: Optional[HardwarePWM] = None
+
+        output = gpiod.LineSettings(
+            direction=Direction.OUTPUT, output_value=Value.INACTIVE
+        )
+        if self.pwm_channel is not None:
+            try:
+                self.pwm = HardwarePWM(
+                    pwm_channel=self.pwm_channel,
+                    hz=1 / self.step_interval,
+                    chip=const.PWM_CHIP,
+                )
+            except HardwarePWMException as e:
+                # The pwm overlay isn't loaded, see setup.sh
+                logging.warning(
+                    "hardware pwm unavailable on pin %d, pulsing it instead: %s"
+                    % (power_pin, e)
+                )
+                self.pwm_channel = None
+
+        if self.pwm is not None:
+            config = {direction_pin: output}
+        else:
+            config = {power_pin: output, direction_pin: output}
 
-        GPIO.setup(power_pin, GPIO.OUT)
-        GPIO.setup(direction_pin, GPIO.OUT)
+        self.lines = gpiod.request_lines(
+            const.GPIO_CHIP, consumer="logbot", config=config
+        )
 
     def __enter__(self) -> Self:
         return self
@@ -260,30 +366,43 @@ class StepperMotor:
         # TODO: This should only be uncommented once self.down
         # knows to stop after it hits a button
         # self.down()
+        self.lines.release()
 
     def up(self, seconds: int = 4):
         """ Move the stepper upwards """
         # Set the direction
-        GPIO.output(self.direction_pin, self._up)
-
-        start = time.time()
-        while (time.time() - start) < seconds:
-            GPIO.output(self.power_pin, GPIO.HIGH)
-            time.sleep(0.0052)
-            GPIO.output(self.power_pin, GPIO.LOW)
+        self.lines.set_value(self.direction_pin, self._up)
+        self._step(seconds)
 
     # TODO: This should be updated to stop moving down after it
     # hits the button at the bottom
     def down(self, seconds: int = 4):
         """ Move the stepper downwards """
         # Set the direction
-        GPIO.output(self.direction_pin, self._down)
-
-        start = time.time()
-        while (time.time() - start) < seconds:
-            GPIO.output(self.power_pin, GPIO.HIGH)
-            time.sleep(0.0052)
-            GPIO.output(self.power_pin, GPIO.LOW)
+        self.lines.set_value(self.direction_pin, self._down)
+        self._step(seconds)
+
+    def _step(self, seconds: float):
+        """ Pulse the power pin for a duration """
+        if self.pwm is not None:
+            # A square wave at the step rate, timed by the PWM peripheral
+            self.pwm.start(50)
+            try:
+                time.sleep(seconds)
+            finally:
+                self.pwm.stop()
+            return
+
+        set_values = self.lines.set_values
+        high = {self.power_pin: Value.ACTIVE}
+        low = {self.power_pin: Value.INACTIVE}
+
+        seconds_ns = int(seconds * 1_000_000_000)
+        start_ns = time.monotonic_ns()
+        while (time.monotonic_ns() - start_ns) < seconds_ns:
+            set_values(high)
+            time.sleep(self.step_interval)
+            set_values(low)
 
 
 
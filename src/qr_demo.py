@@ -1,18 +1,15 @@
 #!/usr/bin/env python3
 
-from PIL import Image
-from io import BytesIO
-from pyzbar.pyzbar import decode
+from pyzbar.pyzbar import decode, ZBarSymbol
 from picamera2 import Picamera2, Preview
 
 
 def main():
     camera = Picamera2()
 
-    cam_config = camera.create_still_configuration(
-        main={"size": (1920, 1080)},
-        lores={"size": (640, 480)},
-        display="lores"
+    width, height = 640, 480
+    cam_config = camera.create_video_configuration(
+        main={"size": (width, height), "format": "YUV420"}
     )
 
     camera.configure(cam_config)
@@ -20,11 +17,12 @@ def main():
     camera.start_preview(Preview.NULL)
     camera.start()
 
-    image_data = BytesIO()
-    camera.capture_file(image_data, format="png")
-
-    image_obj = Image.open(image_data)
-    decoded_data = decode(image_obj)
+    # The stream is YUV420, its first rows are the greyscale (Y) plane
+    frame = camera.capture_array("main")
+    luma = frame[:height, :width]
+    decoded_data = decode(
+        (luma.tobytes(), width, height), symbols=[ZBarSymbol.QRCODE]
+    )
 
     if len(decoded_data) != 0:
         print(decoded_data[0].data.decode())
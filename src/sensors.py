@@ -2,15 +2,18 @@
 
 # This module handles the sensors.
 
+import time
+import logging
+import threading
 import smbus2
+from array import array
 from enum import Enum
-from typing import Self
-from collections import deque, defaultdict
+from typing import Optional, Self
+from collections import deque
 
 # QR Code dependencies
-from PIL import Image
-from io import BytesIO
-from pyzbar.pyzbar import decode
+import numpy as np
+from pyzbar.pyzbar import decode, ZBarSymbol
 from picamera2 import Picamera2, Preview
 
 
@@ -30,7 +33,14 @@ class I2CSensors:
         self.bus = smbus2.SMBus(1)
         self.address = address
         # Dictionary that maps Sensors to a deque of it's last 'maxlen' values,
-        self.averages: defaultdict[Sensors, deque[int]] = defaultdict(lambda: deque(maxlen=maxlen))
+        self.averages: dict[Sensors, deque[int]] = {
+            sensor: deque(maxlen=maxlen) for sensor in Sensors
+        }
+        # Running sum of the values in each deque, so averages are O(1)
+        self._sums: dict[Sensors, int] = {sensor: 0 for sensor in Sensors}
+        # Transactions consist of multiple bus calls, which must not interleave
+        # when sensors are read from multiple threads
+        self.lock = threading.Lock()
 
     def __enter__(self) -> Self:
         return self
@@ -40,34 +50,156 @@ class I2CSensors:
         self.bus.close()
 
     def _read(self, channel: int) -> int:
-        self.bus.write_byte(self.address, 0x40 | channel)
+        """Read a channel, the caller must hold self.lock"""
+        # Select the channel and read two bytes in a single transaction.
+        # The first (low) byte is the previous conversion and is discarded
+        return self.bus.read_word_data(self.address, 0x40 | channel) >> 8
 
-        # Dummy read to start ADC conversion
-        self.bus.read_byte(self.address)
-        return self.bus.read_byte(self.address)
+    def _record(self, sensor: Sensors, value: int):
+        """Append a value to the history, keeping the running sum in sync"""
+        values = self.averages[sensor]
+        if len(values) == values.maxlen:
+            self._sums[sensor] -= values[0]
+        values.append(value)
+        self._sums[sensor] += value
 
     def read(self, sensor: Sensors) -> int:
         """Read the current sensor value (updates averages)"""
-        value = self._read(sensor.value)
-        self.averages[sensor].append(value)
+        with self.lock:
+            value = self._read(sensor.value)
+            self._record(sensor, value)
 
         return value
 
+    def read_lr(self) -> tuple[int, int]:
+        """
+        Read both the left and right sensor in a single I2C transaction
+        (updates averages)
+        """
+        # Auto-increment the channel after each read, the first byte is the
+        # result of the previous conversion and gets discarded
+        with self.lock:
+            _, left, right = self.bus.read_i2c_block_data(
+                self.address, 0x44 | Sensors.LEFT.value, 3
+            )
+            self._record(Sensors.LEFT, left)
+            self._record(Sensors.RIGHT, right)
+
+        return left, right
+
     def average(self, sensor: Sensors) -> float:
         """Read the average over the last maxlen reads"""
-        assert sensor in self.averages, "Sensor history empty, call .read() first"
         values = self.averages[sensor]
-        return sum(values) / len(values)
+        assert values, "Sensor history empty, call .read() first"
+        return self._sums[sensor] / len(values)
+
+
+class SensorPoller:
+    """
+    Continuously samples both sensors on a background thread.
+    The most recent values are kept in 'latest', indexed by the sensor channel,
+    so control loops don't have to wait on the I2C bus.
+    'samples' counts the polls, control loops wait on it to run once per sample.
+    """
+
+    # Longest pause between reads while the bus keeps failing
+    max_backoff = 0.1
+    # Failed reads between repeated warnings while the bus keeps failing
+    warn_every = 100
+
+    def __init__(self, sensors: I2CSensors, interval: float = 0.001):
+        assert interval >= 0, "interval should not be negative"
+        self.sensors = sensors
+        self.interval = interval
+        self.latest = array('H', [0] * len(Sensors))
+        self.samples = 0
+        # Notified after every new sample
+        self.sampled = threading.Condition()
+
+        self._running = False
+        self._thread: Optional[threading.Thread] = None
+
+    def __enter__(self) -> Self:
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        """ Stop the polling thread. """
+        self.stop()
+
+    def _poll(self):
+        latest = self.latest
+        read_lr = self.sensors.read_lr
+        sampled = self.sampled
+        left, right = Sensors.LEFT.value, Sensors.RIGHT.value
+        failures = 0
+        delay = self.interval
+
+        while self._running:
+            try:
+                values = read_lr()
+            except OSError as e:
+                if failures % self.warn_every == 0:
+                    logging.warning(
+                        "sensor poller: read failed (%d in a row): %s" % (failures + 1, e)
+                    )
+                failures += 1
+                # Back off, so a missing device doesn't flood the bus and log
+                delay = min(max(delay * 2, 0.001), self.max_backoff)
+            else:
+                if failures:
+                    logging.info("sensor poller: recovered after %d failed reads" % failures)
+                    failures = 0
+                    delay = self.interval
+
+                with sampled:
+                    latest[left], latest[right] = values
+                    self.samples += 1
+                    sampled.notify_all()
+            time.sleep(delay)
+
+    def start(self):
+        """Start polling, the first sample is taken before returning"""
+        assert self._thread is None, "poller is already running"
+        latest = self.latest
+        latest[Sensors.LEFT.value], latest[Sensors.RIGHT.value] = self.sensors.read_lr()
+        self.samples += 1
+
+        self._running = True
+        self._thread = threading.Thread(target=self._poll, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop polling and wait for the thread to finish"""
+        self._running = False
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def wait(self, last: int, timeout: Optional[float] = 0.1) -> int:
+        """
+        Wait until a sample newer than 'last' is taken, return its number.
+        Returns 'last' if no new sample arrived within the timeout.
+        """
+        with self.sampled:
+            self.sampled.wait_for(lambda: self.samples != last, timeout)
+            return self.samples
+
+    def read(self, sensor: Sensors) -> int:
+        """Get the latest sampled value of a sensor"""
+        return self.latest[sensor.value]
 
 
 class Camera:
+    # Frame size used for reading QR codes
+    size = (640, 480)
+
     def __init__(self):
         self.camera = Picamera2()
 
-        cam_config = self.camera.create_still_configuration(
-            main={"size": (1920, 1080)},
-            lores={"size": (640, 480)},
-            display="lores"
+        # A single small YUV420 stream is enough for reading QR codes
+        cam_config = self.camera.create_video_configuration(
+            main={"size": self.size, "format": "YUV420"}
         )
 
         self.camera.configure(cam_config)
@@ -76,14 +208,20 @@ class Camera:
         self.camera.start_preview(Preview.NULL)
         self.camera.start()
 
-    def capture_image(self) -> BytesIO:
-        image_data = BytesIO()
-        self.camera.capture_file(image_data, format="png")
-        return image_data
+    def capture_image(self) -> np.ndarray:
+        """
+        Capture a greyscale frame.
+        The stream is YUV420, so the first rows are the luma (Y) plane.
+        """
+        width, height = self.size
+        frame = self.camera.capture_array("main")
+        return frame[:height, :width]
 
     def read_qr(self) -> list[str]:
         image = self.capture_image()
-        image_obj = Image.open(image)
-        decoded_data = decode(image_obj)
+        height, width = image.shape
+        decoded_data = decode(
+            (image.tobytes(), width, height), symbols=[ZBarSymbol.QRCODE]
+        )
 
         return [code.data.decode() for code in decoded_data]
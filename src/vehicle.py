@@ -1,6 +1,10 @@
 from enum import Enum
-from typing import Optional
+from typing import Optional, Self
 
+import gpiod
+from gpiod.line import Direction, Value
+
+import const
 from motors import Motor, MotorDirection
 
 
@@ -26,15 +30,99 @@ class VehicleDirection(Enum):
 # Assert that all variants in VehicleDirection are unique
 assert len(set(VehicleDirection.__members__.values())) == 4
 
+# Motor directions and speed ratios for each direction, as
+# (left direction, left ratio, right direction, right ratio)
+_VEHICLE_TABLE = {
+    VehicleDirection.FORWARD: (
+        MotorDirection.FORWARD, 1.0, MotorDirection.FORWARD, 1.0
+    ),
+    VehicleDirection.BACKWARD: (
+        MotorDirection.BACKWARD, 1.0, MotorDirection.BACKWARD, 1.0
+    ),
+    VehicleDirection.LEFT: (
+        MotorDirection.FORWARD, 1 / 3, MotorDirection.FORWARD, 1.0
+    ),
+    VehicleDirection.RIGHT: (
+        MotorDirection.FORWARD, 1.0, MotorDirection.FORWARD, 1 / 3
+    ),
+}
+
+# Motor directions for each spin direction, as (left, right)
+_SPIN_TABLE = {
+    SpinDirection.LEFT: (MotorDirection.BACKWARD, MotorDirection.FORWARD),
+    SpinDirection.RIGHT: (MotorDirection.FORWARD, MotorDirection.BACKWARD),
+}
+
 
 class Vehicle:
     """ This class represents a Vehicle. In this case with 2 motors. """
 
-    def __init__(self, left: Motor, right: Motor, default_speed: float):
+    @staticmethod
+    def new(
+        left_power_pin: int,
+        left_direction_pin: int,
+        right_power_pin: int,
+        right_direction_pin: int,
+        default_speed: float,
+    ) -> "Vehicle":
+        """
+        Create a Vehicle and its motors. Both direction pins share a single
+        line request owned by the Vehicle, so they are written together
+        """
+        lines = gpiod.request_lines(
+            const.GPIO_CHIP,
+            consumer="logbot",
+            config={
+                (left_direction_pin, right_direction_pin): gpiod.LineSettings(
+                    direction=Direction.OUTPUT, output_value=Value.INACTIVE
+                )
+            },
+        )
+        try:
+            left = Motor.new_left(left_power_pin, left_direction_pin, lines)
+            try:
+                right = Motor.new_right(right_power_pin, right_direction_pin, lines)
+            except BaseException:
+                left.__exit__(None, None, None)
+                raise
+        except BaseException:
+            lines.release()
+            raise
+
+        return Vehicle(left, right, default_speed, lines)
+
+    def __init__(
+        self,
+        left: Motor,
+        right: Motor,
+        default_speed: float,
+        lines: Optional[gpiod.LineRequest] = None,
+    ):
+        """
+        lines: Request shared by the direction pins of both motors, the
+        Vehicle takes ownership of it. Without it each motor writes its own
+        """
         self.left = left
         self.right = right
         self.speed = 0.0
         self.default_speed = default_speed
+        self.lines = lines
+
+    def __enter__(self) -> Self:
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        """ Reset both motors and release the shared line request """
+        # Each wheel is cleaned up even if the other one fails to,
+        # so a failure can't leave a wheel driving
+        try:
+            self.left.__exit__(exc_type, exc_val, exc_tb)
+        finally:
+            try:
+                self.right.__exit__(exc_type, exc_val, exc_tb)
+            finally:
+                if self.lines is not None:
+                    self.lines.release()
 
     def move(
         self,
@@ -52,23 +140,14 @@ class Vehicle:
         previous_speed = self.speed
         self.speed = self.default_speed if speed is None else speed
 
-        match direction:
-            case VehicleDirection.FORWARD:
-                self.left.move(MotorDirection.FORWARD, self.speed)
-                self.right.move(MotorDirection.FORWARD, self.speed)
-            case VehicleDirection.BACKWARD:
-                self.left.move(MotorDirection.BACKWARD, self.speed)
-                self.right.move(MotorDirection.BACKWARD, self.speed)
-            case VehicleDirection.LEFT:
-                self.left.move(MotorDirection.FORWARD, self.speed / 3)
-                self.right.move(MotorDirection.FORWARD, self.speed)
-            case VehicleDirection.RIGHT:
-                self.left.move(MotorDirection.FORWARD, self.speed)
-                self.right.move(MotorDirection.FORWARD, self.speed / 3)
-            case _:
-                raise NotImplementedError(
-                    f"VehicleDirection not covered: {repr(direction)}"
-                )
+        try:
+            left, left_ratio, right, right_ratio = _VEHICLE_TABLE[direction]
+        except KeyError:
+            raise NotImplementedError(
+                f"VehicleDirection not covered: {repr(direction)}"
+            )
+
+        self._apply(left, self.speed * left_ratio, right, self.speed * right_ratio)
 
         return previous_speed
 
@@ -89,20 +168,48 @@ class Vehicle:
         previous_speed = self.speed
         self.speed = self.default_speed if speed is None else speed
 
-        match direction:
-            case SpinDirection.LEFT:
-                self.left.move(MotorDirection.BACKWARD, self.speed)
-                self.right.move(MotorDirection.FORWARD, self.speed)
-            case SpinDirection.RIGHT:
-                self.left.move(MotorDirection.FORWARD, self.speed)
-                self.right.move(MotorDirection.BACKWARD, self.speed)
-            case _:
-                raise NotImplementedError(
-                    f"SpinDirection not covered: {repr(direction)}"
-                )
+        try:
+            left, right = _SPIN_TABLE[direction]
+        except KeyError:
+            raise NotImplementedError(
+                f"SpinDirection not covered: {repr(direction)}"
+            )
+
+        self._apply(left, self.speed, right, self.speed)
 
         return previous_speed
 
+    def _apply(
+        self,
+        left_direction: MotorDirection,
+        left_speed: float,
+        right_direction: MotorDirection,
+        right_speed: float,
+    ):
+        """
+        Set both directions before touching either speed, so both wheels
+        change speed back-to-back instead of one direction write apart
+        """
+        left, right = self.left, self.right
+
+        if self.lines is None:
+            left.set_direction(left_direction)
+            right.set_direction(right_direction)
+        else:
+            left_value = left.direction_value(left_direction)
+            right_value = right.direction_value(right_direction)
+            # Write both direction pins in a single call, only on changes
+            if left_value != left.direction or right_value != right.direction:
+                self.lines.set_values({
+                    left.direction_pin: left_value,
+                    right.direction_pin: right_value,
+                })
+                left.direction = left_value
+                right.direction = right_value
+
+        left.set_speed(left_speed)
+        right.set_speed(right_speed)
+
     def stop(self) -> float:
         """
         Stop the vehicle
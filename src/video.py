@@ -1,12 +1,13 @@
 #!/usr/bin/env python3
 
-# This is the same as mjpeg_server.py, but uses the h/w MJPEG encoder.
+# Based on mjpeg_server.py, but uses the h/w MJPEG encoder and serves all
+# clients from a single asyncio event loop.
 
 import io
+import gzip
+import asyncio
 import logging
-import socketserver
-from http import server
-from threading import Condition
+from typing import Optional
 
 from picamera2 import Picamera2
 from picamera2.encoders import MJPEGEncoder
@@ -23,74 +24,198 @@ PAGE: bytes = """\
 </body>
 </html>
 """.encode()
+PAGE_GZ: bytes = gzip.compress(PAGE)
+
+# Response headers of the MJPEG stream, which never change.
+# The stream never ends, so the connection can't be kept alive afterwards
+STREAM_HEADERS: bytes = (
+    b'HTTP/1.1 200 OK\r\n'
+    b'Age: 0\r\n'
+    b'Cache-Control: no-cache, private\r\n'
+    b'Pragma: no-cache\r\n'
+    b'Connection: close\r\n'
+    b'Content-Type: multipart/x-mixed-replace; boundary=FRAME\r\n'
+    b'\r\n'
+)
+
+# Multipart headers preceding each frame, formatted with the frame length
+FRAME_HEADER: bytes = (
+    b'--FRAME\r\n'
+    b'Content-Type: image/jpeg\r\n'
+    b'Content-Length: %d\r\n'
+    b'\r\n'
+)
+
+
+# Frames a streaming client may fall behind by before older ones are dropped
+CLIENT_QUEUE_SIZE = 2
+
+REASONS = {200: 'OK', 301: 'Moved Permanently', 400: 'Bad Request',
+           404: 'Not Found', 501: 'Not Implemented'}
 
 
 class StreamingOutput(io.BufferedIOBase):
-    def __init__(self):
-        self.frame = None
-        self.condition = Condition()
+    """
+    Hands frames from the encoder thread to the event loop, which fans them
+    out to a queue per streaming client. A client that falls behind has its
+    oldest frames dropped instead of buffering them.
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        self.loop = loop
+        self.latest: Optional[bytes] = None
+        # Set once the next frame arrives, replaced after every frame
+        self.ready = asyncio.Event()
+        self.clients: set[asyncio.Queue] = set()
 
     def write(self, buf):
-        with self.condition:
-            self.frame = buf
-            self.condition.notify_all()
+        # Called from the encoder thread, everything else runs in the loop
+        self.loop.call_soon_threadsafe(self._publish, bytes(buf))
         return len(buf)
 
+    def _publish(self, frame: bytes):
+        self.latest = frame
+        ready, self.ready = self.ready, asyncio.Event()
+        ready.set()
+        for queue in self.clients:
+            if queue.full():
+                queue.get_nowait()
+            queue.put_nowait(frame)
+
+    async def next_frame(self) -> bytes:
+        """Return the latest frame, waiting for the first one if needed"""
+        while self.latest is None:
+            await self.ready.wait()
+        return self.latest
+
+
+def response_head(status: int, headers: dict[str, str]) -> bytes:
+    lines = ['HTTP/1.1 %d %s' % (status, REASONS[status])]
+    lines += ['%s: %s' % header for header in headers.items()]
+    return ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1')
+
+
+async def read_request(reader: asyncio.StreamReader):
+    """
+    Read a request head, return its method, path, version and headers,
+    or None once the client closes the connection
+    """
+    try:
+        head = await reader.readuntil(b'\r\n\r\n')
+    except asyncio.IncompleteReadError:
+        return None
+
+    request_line, *header_lines = head.decode('latin-1').split('\r\n')
+    method, path, version = request_line.split(' ', 2)
+    headers = {}
+    for line in header_lines:
+        if line:
+            name, _, value = line.partition(':')
+            headers[name.strip().lower()] = value.strip()
+    return method, path, version, headers
+
+
+def send_page(writer: asyncio.StreamWriter, headers: dict[str, str],
+              head: bool = False):
+    # Send the precompressed page if the client accepts it
+    if 'gzip' in headers.get('accept-encoding', ''):
+        body = PAGE_GZ
+        response = {'Content-Encoding': 'gzip'}
+    else:
+        body = PAGE
+        response = {}
+
+    writer.write(response_head(200, {
+        'Content-Type': 'text/html',
+        **response,
+        'Content-Length': str(len(body)),
+        'Vary': 'Accept-Encoding',
+    }))
+    if not head:
+        writer.write(body)
+
+
+async def send_stream(writer: asyncio.StreamWriter):
+    queue = asyncio.Queue(maxsize=CLIENT_QUEUE_SIZE)
+    output.clients.add(queue)
+    try:
+        writer.write(STREAM_HEADERS)
+        while True:
+            frame = await queue.get()
+            # Send headers, frame and trailer in a single write
+            writer.write(FRAME_HEADER % len(frame) + frame + b'\r\n')
+            await writer.drain()
+    finally:
+        output.clients.discard(queue)
+
+
+async def handle_client(reader: asyncio.StreamReader,
+                        writer: asyncio.StreamWriter):
+    # asyncio already sets TCP_NODELAY, frames go out without waiting on ACKs
+    client = writer.get_extra_info('peername')
+    try:
+        # Keep connections alive between requests, every response has a length
+        while (request := await read_request(reader)) is not None:
+            method, path, version, headers = request
+            logging.info('%s "%s %s %s"', client, method, path, version)
+
+            if method not in ('GET', 'HEAD'):
+                writer.write(response_head(
+                    501, {'Content-Length': '0', 'Connection': 'close'}))
+                break
+
+            head = method == 'HEAD'
+            match path:
+                case '/':
+                    writer.write(response_head(
+                        301, {'Location': '/index.html', 'Content-Length': '0'}))
+                case '/index.html':
+                    send_page(writer, headers, head)
+                case '/frame.jpg' if not head:
+                    # Latest frame as a plain JPEG, used for reading QR codes
+                    frame = await output.next_frame()
+                    writer.write(response_head(200, {
+                        'Content-Type': 'image/jpeg',
+                        'Content-Length': str(len(frame)),
+                    }))
+                    writer.write(frame)
+                case '/stream.mjpg' if not head:
+                    # The stream never ends, the connection closes with it
+                    await send_stream(writer)
+                    break
+                case _:
+                    writer.write(response_head(404, {'Content-Length': '0'}))
+            await writer.drain()
+
+            if (headers.get('connection', '').lower() == 'close'
+                    or version != 'HTTP/1.1'):
+                break
+    except (ConnectionError, ValueError, asyncio.LimitOverrunError) as e:
+        logging.warning('Removed client %s: %s', client, str(e))
+    finally:
+        writer.close()
+
+
+async def main():
+    global output
+    output = StreamingOutput(asyncio.get_running_loop())
+
+    picam2 = Picamera2()
+    picam2.configure(
+        picam2.create_video_configuration(main={"size": (640, 480)}))
+    picam2.start_recording(MJPEGEncoder(), FileOutput(output))
+
+    try:
+        # All clients are served from this thread by the event loop
+        server = await asyncio.start_server(
+            handle_client, '', 8080, reuse_address=True)
+        async with server:
+            await server.serve_forever()
+    finally:
+        picam2.stop_recording()
+
+
+output: StreamingOutput
 
-class StreamingHandler(server.BaseHTTPRequestHandler):
-    def do_GET(self):
-        match self.path:
-            case '/':
-                self.send_response(301)
-                self.send_header('Location', '/index.html')
-                self.end_headers()
-            case '/index.html':
-                self.send_response(200)
-                self.send_header('Content-Type', 'text/html')
-                self.send_header('Content-Length', str(len(PAGE)))
-                self.end_headers()
-                self.wfile.write(PAGE)
-            case '/stream.mjpg':
-                self.send_response(200)
-                self.send_header('Age', str(0))
-                self.send_header('Cache-Control', 'no-cache, private')
-                self.send_header('Pragma', 'no-cache')
-                self.send_header('Content-Type', 'multipart/x-mixed-replace; boundary=FRAME')
-                self.end_headers()
-                try:
-                    while True:
-                        with output.condition:
-                            output.condition.wait()
-                            frame = output.frame
-                            assert frame is not None
-
-                        self.wfile.write(b'--FRAME\r\n')
-                        self.send_header('Content-Type', 'image/jpeg')
-                        self.send_header('Content-Length', str(len(frame)))
-                        self.end_headers()
-                        self.wfile.write(frame)
-                        self.wfile.write(b'\r\n')
-                except Exception as e:
-                    logging.warning(
-                        'Removed streaming client %s: %s',
-                        self.client_address, str(e))
-            case _:
-                self.send_error(404)
-                self.end_headers()
-
-
-class StreamingServer(socketserver.ThreadingMixIn, server.HTTPServer):
-    allow_reuse_address = True
-    daemon_threads = True
-
-picam2 = Picamera2()
-picam2.configure(picam2.create_video_configuration(main={"size": (640, 480)}))
-output = StreamingOutput()
-picam2.start_recording(MJPEGEncoder(), FileOutput(output))
-
-try:
-    address = ('', 8080)
-    server = StreamingServer(address, StreamingHandler)
-    server.serve_forever()
-finally:
-    picam2.stop_recording()
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -32,7 +32,7 @@ def create_app():
 
     @login_manager.user_loader
     def load_user(user_id):
-        return User.query.get(int(user_id))
+        return db.session.get(User, int(user_id))
 
     from .auth import auth_blueprint
     app.register_blueprint(auth_blueprint)
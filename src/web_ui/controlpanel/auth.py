@@ -1,12 +1,61 @@
 #!/usr/bin/env python3
 
-from werkzeug.security import check_password_hash
-from flask import Blueprint, render_template, request, redirect, url_for, flash
+import hmac
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+from werkzeug.security import check_password_hash, generate_password_hash
+from flask import Blueprint, render_template, request, redirect, url_for, flash, current_app
 from flask_login import login_user, login_required, logout_user
 from .models import User
 
 auth_blueprint = Blueprint("auth", __name__)
 
+# Checked against for unknown usernames, so they take as long as known ones
+DUMMY_PASSWORD_HASH = generate_password_hash("logbot")
+
+# Successful password checks, keyed by the stored password hash and a keyed
+# digest of the given password (never the password itself). A changed hash
+# misses the cache, so entries never go stale. Failed checks are never cached,
+# so a wrong password always pays the hash like an unknown username does and
+# response times don't reveal which usernames exist
+CREDENTIAL_CACHE_SIZE = 1024
+_credential_cache: OrderedDict[tuple[str, str], None] = OrderedDict()
+_credential_cache_lock = threading.Lock()
+
+
+def verify_credentials(username: str, password: str) -> Optional[User]:
+    """
+    Return the user if the credentials are correct, None otherwise.
+    Correct passwords are cached, so repeated logins skip the hash.
+    """
+    user = User.query.filter_by(username=username).first()
+
+    if user is None:
+        check_password_hash(DUMMY_PASSWORD_HASH, password)
+        return None
+
+    digest = hmac.new(
+        current_app.config["SECRET_KEY"].encode(), password.encode(), "sha256"
+    ).hexdigest()
+    key = (user.password, digest)
+
+    with _credential_cache_lock:
+        if key in _credential_cache:
+            _credential_cache.move_to_end(key)
+            return user
+
+    if not check_password_hash(user.password, password):
+        return None
+
+    with _credential_cache_lock:
+        _credential_cache[key] = None
+        if len(_credential_cache) > CREDENTIAL_CACHE_SIZE:
+            _credential_cache.popitem(last=False)
+
+    return user
+
 
 @auth_blueprint.route("/login", methods=["GET", "POST"])
 def login():
@@ -17,9 +66,13 @@ def login():
     password = request.form.get("password")
     remember = True if request.form.get("remember") else False
 
-    user = User.query.filter_by(username=username).first()
+    user = (
+        verify_credentials(username, password)
+        if username is not None and password is not None
+        else None
+    )
 
-    if not user or not check_password_hash(user.password, password):
+    if not user:
         flash("Incorrect credentials!")
         return redirect(url_for("auth.login"))
 
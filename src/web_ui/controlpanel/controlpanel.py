@@ -1,20 +1,15 @@
 #!/usr/bin/env python3
 
-import requests
-
-from PIL import Image
-from PIL import ImageFile
-from io import BytesIO
-
-from pyzbar.pyzbar import decode
-
 from flask import Blueprint, render_template
 from flask_login import login_required
 
-ImageFile.LOAD_TRUNCATED_IMAGES = True
+from .qrreader import QRReader
 
 controlpanel_blueprint = Blueprint("controlpanel", __name__)
 
+# Decodes frames of the video stream in the background
+qr_reader = QRReader("http://127.0.0.1:8080/frame.jpg")
+
 
 @controlpanel_blueprint.route('/', methods=["GET"])
 def index():
@@ -30,26 +25,9 @@ def controlpanel():
 
 @controlpanel_blueprint.route('/qrcode', methods=["POST"])
 def qrcode():
-    resp = requests.get("http://127.0.0.1/stream", stream=True)
-    stream_content_generator = resp.iter_content(chunk_size=64)
-
-    headers = next(stream_content_generator).split(b"\n", 4)
-    content_length = int(headers[2].split(b" ")[1])
-
-    beginning_of_image_data = headers[4]
-
-    content_length = content_length - len(beginning_of_image_data)
-
-    image_data = beginning_of_image_data
-    new_image_generator = resp.iter_content(chunk_size=8192)
-    while len(image_data) < content_length:
-        image_data += next(new_image_generator)
-
-    image_obj = Image.open(BytesIO(image_data[:content_length]))
-
-    decoded_data = decode(image_obj)
+    result = qr_reader.read()
 
-    if len(decoded_data) != 0:
-        return decoded_data[0].data.decode()
+    if result is not None:
+        return result
     else:
         return "Reading QR code failed!"
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+
+import time
+import logging
+import threading
+from http.client import HTTPConnection, HTTPException
+from io import BytesIO
+from typing import Optional
+from urllib.parse import urlsplit
+
+from PIL import Image
+from PIL import ImageFile
+
+from pyzbar.pyzbar import decode, ZBarSymbol
+
+ImageFile.LOAD_TRUNCATED_IMAGES = True
+
+
+class QRReader:
+    """
+    Decodes QR codes from the newest camera frame on a background thread,
+    so requests only return the latest result instead of decoding inline.
+    The thread starts on the first read and stops once reads stop coming in.
+    """
+
+    def __init__(self, url: str, interval: float = 0.2, idle_timeout: float = 30.0):
+        self.url = url
+        self.interval = interval
+        # Frames are fetched over a single kept-alive connection
+        self._connection: Optional[HTTPConnection] = None
+        self.idle_timeout = idle_timeout
+
+        self._result: Optional[str] = None
+        # Set once a frame has been decoded since the thread started
+        self._decoded = threading.Event()
+        self._last_read = 0.0
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def read(self, timeout: float = 2.0) -> Optional[str]:
+        """
+        Return the data of the latest decoded QR code, None if there is none.
+        Waits up to timeout for the first decode if the reader was idle.
+        """
+        with self._lock:
+            self._last_read = time.monotonic()
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+
+        self._decoded.wait(timeout)
+        return self._result
+
+    def _fetch_frame(self) -> bytearray:
+        """Fetch the newest frame, read straight into a buffer of its length"""
+        url = urlsplit(self.url)
+        if self._connection is None:
+            self._connection = HTTPConnection(url.hostname, url.port, timeout=5)
+
+        try:
+            self._connection.request("GET", url.path)
+            resp = self._connection.getresponse()
+            if resp.status != 200:
+                resp.read()
+                raise HTTPException(f"unexpected status {resp.status}")
+
+            length = int(resp.getheader("Content-Length"))
+            frame = bytearray(length)
+            view = memoryview(frame)
+            received = 0
+            while received < length:
+                count = resp.readinto(view[received:])
+                if count == 0:
+                    raise HTTPException("connection closed mid-frame")
+                received += count
+            return frame
+        except (HTTPException, OSError, TypeError, ValueError):
+            self._connection.close()
+            self._connection = None
+            raise
+
+    def _decode_frame(self) -> Optional[str]:
+        """Fetch the newest frame and decode a QR code from it"""
+        image_obj = Image.open(BytesIO(self._fetch_frame()))
+        # Have libjpeg decode only the luma plane, pyzbar scans greyscale anyway
+        image_obj.draft("L", image_obj.size)
+        image_obj = image_obj.convert("L")
+
+        decoded_data = decode(
+            (image_obj.tobytes(), image_obj.width, image_obj.height),
+            symbols=[ZBarSymbol.QRCODE],
+        )
+
+        if len(decoded_data) != 0:
+            return decoded_data[0].data.decode()
+        return None
+
+    def _stop(self):
+        """Reset the reader to idle, the caller must hold the lock"""
+        self._decoded.clear()
+        self._result = None
+        self._thread = None
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+    def _run(self):
+        try:
+            while True:
+                with self._lock:
+                    if time.monotonic() - self._last_read > self.idle_timeout:
+                        # Nobody is asking for results, stop until the next read
+                        self._stop()
+                        return
+
+                try:
+                    self._result = self._decode_frame()
+                except Exception as e:
+                    # Any failure only costs this frame, the thread keeps going
+                    logging.warning("qr reader: reading frame failed: %s" % e)
+                    self._result = None
+                self._decoded.set()
+
+                time.sleep(self.interval)
+        finally:
+            # If the thread dies anyway, let the next read start a new one
+            with self._lock:
+                if self._thread is threading.current_thread():
+                    self._stop()